@@ -1,65 +1,274 @@
-import json
+from __future__ import annotations
+
+import re
 import datetime
 import time
+import pickle
 import warnings
+import functools
 import multiprocessing
-from typing import Literal, Callable
-from itertools import pairwise
-from statistics import median
+from itertools import chain
+from typing import TYPE_CHECKING, Any, BinaryIO, Iterable, Literal, Callable, TypeVar
 from pathlib import Path
 from collections import defaultdict, Counter
 
+import ijson
 import numpy as np
-import plotly.graph_objects as go
 
 from src.message import Message, reply_chain
 
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+if TYPE_CHECKING:
+    import plotly.graph_objects as go
+
 
 GroupbyKeys = Literal["day", "week", "month"]
+T = TypeVar("T")
+
+# parsed chats are cached next to the export as <name>.msgs.pkl;
+# bump CACHE_VERSION whenever the pickled Chat/Message layout changes
+CACHE_SUFFIX = ".msgs.pkl"
+CACHE_VERSION = 3
+
+# exports larger than this are stream-parsed with ijson unless `stream` is given
+STREAM_THRESHOLD_BYTES = 1 << 30
+
+
+def _detached(result: T) -> T:
+    """Shield a cached result from callers: arrays are made read-only and the
+    containers holding them (dicts, Counters, tuples) are shallow-copied."""
+    if isinstance(result, np.ndarray):
+        result.flags.writeable = False
+        return result
+    if isinstance(result, tuple):
+        return tuple(_detached(item) for item in result)
+    if isinstance(result, dict):
+        return type(result)({key: _detached(value) for key, value in result.items()})
+    return result
+
+
+def _memoized(method: Callable[[Chat], T]) -> Callable[[Chat], T]:
+    """Cache the result of an argument-less Chat method (messages never change)."""
+
+    @functools.wraps(method)
+    def wrapper(self: Chat) -> T:
+        if method.__name__ not in self._results_cache:
+            self._results_cache[method.__name__] = method(self)
+        return _detached(self._results_cache[method.__name__])
+
+    return wrapper
+
+
+@functools.cache
+def _keyword_matcher(words: tuple[str, ...]) -> Callable[[str], bool]:
+    """Build a 'lowercased text contains any of the words' predicate.
+    Cached, so a keyword list is compiled once and shared by all chats."""
+    lowered = [word.lower() for word in words]
+    if not lowered:
+        return lambda text: False
+    if "" in lowered:
+        return lambda text: True
+    if len(lowered) == 1:
+        word = lowered[0]
+        return lambda text: word in text
+    if ahocorasick is None:
+        pattern = re.compile("|".join(map(re.escape, lowered)))
+        return lambda text: pattern.search(text) is not None
+    automaton = ahocorasick.Automaton()
+    for word in lowered:
+        automaton.add_word(word, word)
+    automaton.make_automaton()
+    return lambda text: next(automaton.iter(text), None) is not None
 
 
 class Chat:
+    """A personal chat parsed from a Telegram JSON export.
+
+    With `use_cache`, the parsed messages are pickled next to the export as
+    <name>.msgs.pkl and loaded from there on later runs; only enable it for
+    export folders you trust, since unpickling can run arbitrary code."""
+
+    __slots__ = (
+        "id_name",
+        "chat_with",
+        "messages",
+        "you",
+        "_groupby_cache",
+        "_dt64",
+        "_bucket_index_cache",
+        "_texts_lower",
+        "_from_is_me",
+        "_text_len",
+        "_match_mask_cache",
+        "_results_cache",
+    )
+
     @staticmethod
-    def _build_messages(data: dict) -> list[Message]:
-        messages_map = {
-            (this_msg := Message.from_dict(msg)).id: this_msg
-            for msg in data["messages"]
-            if msg["type"] == "message"
-        }
-        for msg in messages_map.values():
+    def _read_header(f: BinaryIO) -> dict:
+        """Read the top-level scalar fields of the export up to the messages array."""
+        header = {}
+        for prefix, event, value in ijson.parse(f):
+            if prefix == "messages" and event == "start_array":
+                break
             if (
-                msg.reply_to_id is not None
-                and (replied_to := messages_map.get(msg.reply_to_id)) is not None
+                prefix
+                and "." not in prefix
+                and event in ("string", "number", "boolean", "null")
             ):
-                msg.reply_to = replied_to
-        return list(messages_map.values())
+                header[prefix] = value
+        f.seek(0)
+        return header
+
+    @staticmethod
+    def _build_messages(
+        raw_messages: Iterable[dict],
+    ) -> tuple[list[Message], dict[str, str]]:
+        participant_id_map = {}
+        messages = []
+        has_replies = False
+        for msg in raw_messages:
+            if (_from_id := msg.get("from_id")) is not None:
+                participant_id_map[_from_id] = msg.get("from")
+            if msg["type"] != "message":
+                continue
+            this_msg = Message.from_dict(msg)
+            messages.append(this_msg)
+            has_replies = has_replies or this_msg.reply_to_id is not None
+        if has_replies:
+            Chat._link_replies(messages)
+        return messages, participant_id_map
 
-    def __init__(self, exported_file: Path):
+    @staticmethod
+    def _link_replies(messages: list[Message]) -> None:
+        """Point every reply at the message it replies to (if it is in the export)."""
+        min_id = min(msg.id for msg in messages)
+        max_id = max(msg.id for msg in messages)
+        if max_id - min_id + 1 > 4 * len(messages):
+            # ids are too sparse for a flat index
+            messages_map = {msg.id: msg for msg in messages}
+            for msg in messages:
+                if msg.reply_to_id is not None:
+                    msg.reply_to = messages_map.get(msg.reply_to_id)
+            return
+        by_id: list[Message | None] = [None] * (max_id - min_id + 1)
+        for msg in messages:
+            by_id[msg.id - min_id] = msg
+        for msg in messages:
+            if msg.reply_to_id is not None and min_id <= msg.reply_to_id <= max_id:
+                msg.reply_to = by_id[msg.reply_to_id - min_id]
+
+    def __init__(
+        self,
+        exported_file: Path,
+        stream: bool | None = None,
+        use_cache: bool = False,
+    ):
         t0 = time.perf_counter()
+        if use_cache and (state := self._load_cache(exported_file)) is not None:
+            self.__setstate__(state)
+        else:
+            self._load_export(exported_file, stream)
+            self._init_caches()
+            if use_cache:
+                self._save_cache(exported_file)
+        print(f"[{time.perf_counter() - t0:.2f}s] {self}")
+
+    def _load_export(self, exported_file: Path, stream: bool | None) -> None:
+        if stream is None:
+            stream = exported_file.stat().st_size > STREAM_THRESHOLD_BYTES
         self.id_name = exported_file.stem
-        with exported_file.open(encoding="utf-8") as f:
-            data = json.load(f)
+        with exported_file.open("rb") as f:
+            if stream:
+                header = self._read_header(f)
+                raw_messages = ijson.items(f, "messages.item")
+            else:
+                header = json_loads(f.read())
+                raw_messages = header.pop("messages")
+            if header["type"] != "personal_chat":
+                raise NotImplementedError(
+                    f"Only personal chats are supported ({header['type']})"
+                )
+            messages, participant_id_map = self._build_messages(raw_messages)
+            # release the raw message dicts before the rest of the setup
+            del raw_messages
 
-        participant_id_map = {
-            _from_id: msg.get("from")
-            for msg in data["messages"]
-            if (_from_id := msg.get("from_id")) is not None
-        }
-        if data["type"] != "personal_chat" or len(participant_id_map) != 2:
+        if len(participant_id_map) != 2:
             raise NotImplementedError(
                 f"Only personal chats are supported ({list(participant_id_map.keys())})"
             )
-        chat_with_user_id: str = f"user{data['id']}"
-        self.chat_with: str = data["name"]
+        chat_with_user_id: str = f"user{header['id']}"
+        self.chat_with: str = header["name"]
         if self.chat_with != (upd_name := participant_id_map[chat_with_user_id]):
             warnings.warn(f"Chat name mismatch: {self.chat_with} vs {upd_name}")
             self.chat_with = upd_name
 
-        self.messages = self._build_messages(data)
+        self.messages = messages
         self.you: str = next(
             msg.from_ for msg in self.messages if msg.from_ != self.chat_with
         )
-        print(f"[{time.perf_counter() - t0:.2f}s] {self}")
+
+    @staticmethod
+    def _load_cache(exported_file: Path) -> dict | None:
+        """Return the pickled chat state if the cache is newer than the export."""
+        cache_file = exported_file.with_suffix(CACHE_SUFFIX)
+        if (
+            not cache_file.exists()
+            or cache_file.stat().st_mtime < exported_file.stat().st_mtime
+        ):
+            return None
+        try:
+            with cache_file.open("rb") as f:
+                # the version is its own record so a stale layout is never unpickled
+                if pickle.load(f) != CACHE_VERSION:
+                    return None
+                return pickle.load(f)
+        except Exception:
+            # unreadable, truncated or from an older layout: rebuild it
+            return None
+
+    def _save_cache(self, exported_file: Path) -> None:
+        try:
+            with exported_file.with_suffix(CACHE_SUFFIX).open("wb") as f:
+                pickle.dump(CACHE_VERSION, f, protocol=5)
+                pickle.dump(self.__getstate__(), f, protocol=5)
+        except OSError as e:
+            warnings.warn(f"Could not write the chat cache: {e}")
+
+    def _init_caches(self) -> None:
+        self._groupby_cache: dict[
+            GroupbyKeys, dict[datetime.date | datetime.datetime, list[Message]]
+        ] = {}
+        self._dt64: np.ndarray | None = None
+        self._bucket_index_cache: dict[
+            GroupbyKeys, tuple[list[datetime.date], np.ndarray]
+        ] = {}
+        self._texts_lower: list[str] | None = None
+        self._from_is_me: np.ndarray | None = None
+        self._text_len: np.ndarray | None = None
+        self._match_mask_cache: dict[tuple[str, ...], np.ndarray] = {}
+        self._results_cache: dict[str, Any] = {}
+
+    def __getstate__(self) -> dict:
+        """Pickle only the parsed chat (e.g. when returned from a worker process);
+        the derived caches are rebuilt lazily."""
+        return {
+            attr: getattr(self, attr)
+            for attr in ("id_name", "chat_with", "messages", "you")
+        }
+
+    def __setstate__(self, state: dict) -> None:
+        for attr, value in state.items():
+            setattr(self, attr, value)
+        self._init_caches()
 
     def __repr__(self) -> str:
         return f"Chat({self.chat_with}; {len(self.messages)} messages)"
@@ -67,57 +276,159 @@ class Chat:
     def groupby(
         self, key: GroupbyKeys
     ) -> defaultdict[datetime.date | datetime.datetime, list[Message]]:
-        """Group messages by day, week, or month."""
-        KEYMAP: dict[
-            GroupbyKeys,
-            Callable[[Message], datetime.date | datetime.datetime],
-        ] = {
-            "day": lambda x: x.dt.date(),
-            "week": lambda x: (x.dt - datetime.timedelta(days=x.dt.weekday())).date(),
-            "month": lambda x: x.dt.date().replace(day=1),
-        }
-        grouped = defaultdict(list)
-        for msg in self.messages:
-            grouped[KEYMAP[key](msg)].append(msg)
-        return grouped
+        """Group messages by day, week, or month (cached per key)."""
+        if key not in self._groupby_cache:
+            self._groupby_cache[key] = self._compute_groupby(key)
+        # a fresh defaultdict, so reading a missing date never adds it to the cache
+        return defaultdict(list, self._groupby_cache[key])
+
+    def _compute_groupby(
+        self, key: GroupbyKeys
+    ) -> dict[datetime.date | datetime.datetime, list[Message]]:
+        days, bucket_idx = self._build_bucket_index(key)
+        order = np.argsort(bucket_idx, kind="stable")
+        bounds = np.cumsum(np.bincount(bucket_idx, minlength=len(days)))[:-1]
+        messages = np.empty(len(self.messages), dtype=object)
+        messages[:] = self.messages
+        groups = np.split(messages[order], bounds)
+        return dict(zip(days, (group.tolist() for group in groups)))
+
+    def _sent_by_me(self) -> np.ndarray:
+        """Flag the messages sent by you (cached)."""
+        if self._from_is_me is None:
+            self._from_is_me = np.fromiter(
+                (msg.from_ == self.you for msg in self.messages),
+                dtype=bool,
+                count=len(self.messages),
+            )
+        return self._from_is_me
+
+    def _text_lengths(self) -> np.ndarray:
+        """Length of every message text as an int32 array (cached)."""
+        if self._text_len is None:
+            self._text_len = np.fromiter(
+                (len(msg.text) for msg in self.messages),
+                dtype=np.int32,
+                count=len(self.messages),
+            )
+        return self._text_len
+
+    def _lowercase_texts(self) -> list[str]:
+        """Lowercased message texts for case-insensitive matching (cached)."""
+        if self._texts_lower is None:
+            self._texts_lower = [msg.text.lower() for msg in self.messages]
+        return self._texts_lower
+
+    def _match_mask(self, messages_include: list[str]) -> np.ndarray:
+        """Flag messages containing any of the words (cached per word list)."""
+        key = tuple(messages_include)
+        if key not in self._match_mask_cache:
+            texts = self._lowercase_texts()
+            matches = _keyword_matcher(key)
+            self._match_mask_cache[key] = np.fromiter(
+                map(matches, texts), dtype=bool, count=len(texts)
+            )
+        return self._match_mask_cache[key]
 
+    def _datetimes(self) -> np.ndarray:
+        """Message datetimes as a datetime64[s] array (cached)."""
+        if self._dt64 is None:
+            self._dt64 = np.array(
+                [msg.dt for msg in self.messages], dtype="datetime64[s]"
+            )
+        return self._dt64
+
+    def get_hours(self) -> np.ndarray:
+        """Hour of the day (0-23) each message was sent at."""
+        dt64 = self._datetimes()
+        hours = dt64.astype("datetime64[h]") - dt64.astype("datetime64[D]")
+        return hours.astype(np.intp)
+
+    def _build_bucket_index(
+        self, key: GroupbyKeys
+    ) -> tuple[list[datetime.date], np.ndarray]:
+        """Map every message to the index of its day/week/month bucket."""
+        if key not in self._bucket_index_cache:
+            days = self._datetimes().astype("datetime64[D]")
+            if key == "week":
+                # 1970-01-01 was a Thursday; shift back to the Monday of the week
+                days = days - (days.view(np.int64) + 3) % 7
+            elif key == "month":
+                days = days.astype("datetime64[M]").astype("datetime64[D]")
+            unique_days, bucket_idx = np.unique(days, return_inverse=True)
+            self._bucket_index_cache[key] = (unique_days.tolist(), bucket_idx)
+        return self._bucket_index_cache[key]
+
+    @_memoized
     def get_other_msg_types(self) -> Counter:
-        types = Counter()
-        for message in self.messages:
-            types.update(message.other_text_entity_types)
-        return types
-
-    def get_message_lengths(self) -> defaultdict[str, list[int]]:
-        message_lens = defaultdict(list)
-        for message in self.messages:
-            if message.text:
-                message_lens[message.from_].append(len(message.text))
-        return message_lens
+        return Counter(
+            chain.from_iterable(
+                m.other_text_entity_types
+                for m in self.messages
+                if m.other_text_entity_types
+            )
+        )
 
-    def get_reply_chains(self) -> list[list[Message]]:
-        msg_reply_chains = []
-        for msg in reversed(self.messages):
-            rc = reply_chain(msg)
-            if len(rc) > 1:
-                msg_reply_chains.append(rc)
-        return msg_reply_chains
+    @_memoized
+    def get_message_lengths(self) -> dict[str, np.ndarray]:
+        """Lengths of the non-empty text messages of each sender."""
+        lengths, from_is_me = self._text_lengths(), self._sent_by_me()
+        has_text = lengths > 0
+        return {
+            self.you: lengths[has_text & from_is_me],
+            self.chat_with: lengths[has_text & ~from_is_me],
+        }
 
-    def get_waiting_times(self) -> defaultdict[str, list[float]]:
-        waiting_times = defaultdict(list)
+    def count_messages(self, messages_include: list[str] | None) -> tuple[int, int]:
+        """Number of messages (containing any of the words) sent by you and by them."""
+        from_is_me = self._sent_by_me()
+        if messages_include is None:
+            n_you = int(np.count_nonzero(from_is_me))
+            return n_you, len(self.messages) - n_you
+        mask = self._match_mask(messages_include)
+        return int(mask[from_is_me].sum()), int(mask[~from_is_me].sum())
 
-        for m1, m2 in pairwise(self.messages):
-            if m1.from_ != m2.from_:
-                tot_sec = (m2.dt - m1.dt).total_seconds()
-                waiting_times[m1.from_].append(tot_sec)
+    def get_reply_chains(self) -> list[list[Message]]:
+        """Full reply chains (newest first), one per reply nobody replied to."""
+        parent_ids = {
+            msg.reply_to.id for msg in self.messages if msg.reply_to is not None
+        }
+        return [
+            reply_chain(msg)
+            for msg in reversed(self.messages)
+            if msg.reply_to is not None and msg.id not in parent_ids
+        ]
 
-        return waiting_times
+    @_memoized
+    def get_waiting_times(self) -> dict[str, np.ndarray]:
+        """Seconds until the other person answered, keyed by who sent first."""
+        seconds = np.diff(self._datetimes()).astype(np.float64)
+        from_is_me = self._sent_by_me()
+        switch = from_is_me[:-1] != from_is_me[1:]
+        waiting_times = {
+            self.you: seconds[switch & from_is_me[:-1]],
+            self.chat_with: seconds[switch & ~from_is_me[:-1]],
+        }
+        return {sender: times for sender, times in waiting_times.items() if times.size}
 
     def display_longest_reply_chain(self) -> None:
-        msg_reply_chains = self.get_reply_chains()
-        longest_chain = max(msg_reply_chains, key=len)
-        for i, msg in enumerate(reversed(longest_chain)):
+        # chain length == depth of its last reply; parents usually come first
+        depths: dict[int, int] = {}
+        for msg in self.messages:
+            parent = msg.reply_to
+            depths[msg.id] = (
+                1
+                if parent is None
+                else (depths.get(parent.id) or len(reply_chain(parent))) + 1
+            )
+        deepest = max(
+            (msg for msg in reversed(self.messages) if msg.reply_to is not None),
+            key=lambda msg: depths[msg.id],
+        )
+        for i, msg in enumerate(reversed(reply_chain(deepest))):
             print("  " * i, msg)
 
+    @_memoized
     def get_reaction_counters(self) -> tuple[Counter[str], Counter[str]]:
         me, them = "", ""
         for m in self.messages:
@@ -133,21 +444,17 @@ class Chat:
         self, groupby_key: GroupbyKeys, messages_include
     ) -> go.Scatter:
         """Get a line chart trace with the number of messages by day/week/month."""
+        import plotly.graph_objects as go
+
         if isinstance(messages_include, str):
             messages_include = [messages_include]
-        group = self.groupby(groupby_key)
-        days = list(group.keys())
-        n_messages_lst = [
-            sum(
-                messages_include is None
-                or any(word.lower() in msg.text.lower() for word in messages_include)
-                for msg in day_msgs
-            )
-            for day_msgs in group.values()
-        ]
+        days, bucket_idx = self._build_bucket_index(groupby_key)
+        if messages_include is not None:
+            bucket_idx = bucket_idx[self._match_mask(messages_include)]
+        n_messages = np.bincount(bucket_idx, minlength=len(days))
         return go.Scatter(
             x=days,
-            y=n_messages_lst,
+            y=n_messages,
             mode="lines+markers",
             line_shape="spline",
             name=self.chat_with,
@@ -155,26 +462,46 @@ class Chat:
 
 
 class Chats:
+    """All personal chats exported into a directory (see Chat for `use_cache`)."""
+
     @staticmethod
-    def _load_chats(from_files: list[Path]) -> list[Chat]:
-        return [Chat(file) for file in from_files]
+    def _load_chats(
+        from_files: list[Path], load_chat: Callable[[Path], Chat]
+    ) -> list[Chat]:
+        return [load_chat(file) for file in from_files]
 
     @staticmethod
-    def _load_chats_multi(from_files: list[Path]) -> list[Chat]:
-        with multiprocessing.Pool(processes=multiprocessing.cpu_count()) as pool:
-            chats = pool.map(Chat, from_files)
+    def _load_chats_multi(
+        from_files: list[Path],
+        load_chat: Callable[[Path], Chat],
+        max_workers: int | None = None,
+    ) -> list[Chat]:
+        processes = max(
+            1, min(max_workers or multiprocessing.cpu_count(), len(from_files))
+        )
+        chunksize = max(1, len(from_files) // (processes * 4))
+        with multiprocessing.Pool(processes=processes) as pool:
+            chats = list(pool.imap_unordered(load_chat, from_files, chunksize))
         return chats
 
-    def __init__(self, chats_directory: Path, use_multiproc: bool = True):
+    def __init__(
+        self,
+        chats_directory: Path,
+        use_multiproc: bool = True,
+        stream: bool | None = None,
+        use_cache: bool = False,
+        max_workers: int | None = None,
+    ):
         self.chats_dir = chats_directory
         chats_files = list(self.chats_dir.glob("*.json"))
         print(f"Found {len(chats_files)} chat files")
+        load_chat = functools.partial(Chat, stream=stream, use_cache=use_cache)
         chats = (
-            self._load_chats_multi(chats_files)
+            self._load_chats_multi(chats_files, load_chat, max_workers)
             if use_multiproc
-            else self._load_chats(chats_files)
+            else self._load_chats(chats_files, load_chat)
         )
-        chats.sort(key=lambda chat: len(chat.messages), reverse=True)
+        chats.sort(key=lambda chat: (-len(chat.messages), chat.id_name))
         self.chats = {chat.id_name: chat for chat in chats}
         your_names = [chat.you for chat in chats]
         assert (
@@ -193,6 +520,8 @@ class Chats:
 
     def fig_waiting_times(self, threshold_median: float = 100.0) -> go.Figure:
         """Plot grouped bar chart showing mean waiting time between messages."""
+        import plotly.graph_objects as go
+
         chat_to_waiting_times = {
             chat.chat_with: chat.get_waiting_times() for chat in self
         }
@@ -205,7 +534,7 @@ class Chats:
         for chat_name, waiting_times in chat_to_waiting_times.items():
             for sender, times in waiting_times.items():
                 idx = 0 if sender == self.your_name else 1
-                mdn = median(times)
+                mdn = np.median(times)
                 median_ok = mdn < threshold_median
                 if idx == 0 and median_ok:
                     chat_names.append(chat_name)
@@ -250,24 +579,20 @@ class Chats:
 
     def fig_messages_by_time_of_day(self, normalize: bool = False) -> go.Figure:
         """Plot a line chart with the number of messages by time of day."""
-        by_time_of_day_by_chat = defaultdict(lambda: defaultdict(int))
-        for chat_id, chat in self.chats.items():
-            for message in chat.messages:
-                by_time_of_day_by_chat[chat_id][message.dt.hour] += 1
+        import plotly.graph_objects as go
 
         fig = go.Figure()
-        for chat_id, by_time_of_day in by_time_of_day_by_chat.items():
-            times_, messages_ = zip(*sorted(by_time_of_day.items()))
+        for chat in self:
+            messages_ = np.bincount(chat.get_hours(), minlength=24)
             if normalize:
-                tot_msgs = sum(messages_)
-                messages_ = [val / tot_msgs for val in messages_]
+                messages_ = messages_ / messages_.sum()
             fig.add_trace(
                 go.Scatter(
-                    x=times_,
+                    x=list(range(24)),
                     y=messages_,
                     mode="lines+markers",
                     line_shape="spline",
-                    name=self[chat_id].chat_with,
+                    name=chat.chat_with,
                 )
             )
         fig.update_layout(
@@ -280,26 +605,22 @@ class Chats:
 
     def fig_message_length_statistics(self) -> go.Figure:
         """Plot grouped bar chart showing mean message length with error bars (±3 SE)."""
-
-        chat_to_message_lengths = {
-            chat.chat_with: chat.get_message_lengths() for chat in self
-        }
-
-        fig = go.Figure()
+        import plotly.graph_objects as go
 
         chat_names = []
         medians = ([], [])
         se_values = ([], [])
 
-        for chat_name, message_lengths in chat_to_message_lengths.items():
-            for sender, lengths in message_lengths.items():
-                idx = 0 if sender == self.your_name else 1
-                lengths = np.array(lengths)
-                median = np.median(lengths)
-                stdev = np.std(lengths)
-                se = 3 * stdev / np.sqrt(len(lengths))
-                if idx == 0:
-                    chat_names.append(chat_name)
+        for chat in self:
+            message_lengths = chat.get_message_lengths()
+            chat_names.append(chat.chat_with)
+            for idx, sender in enumerate((chat.you, chat.chat_with)):
+                lengths = message_lengths[sender]
+                if lengths.size:
+                    median = np.median(lengths)
+                    se = 3 * np.std(lengths) / np.sqrt(lengths.size)
+                else:
+                    median = se = np.nan
                 medians[idx].append(median)
                 se_values[idx].append(se)
 
@@ -350,6 +671,8 @@ class Chats:
         return fig
 
     def fig_total_and_most_common_reactions(self) -> go.Figure:
+        import plotly.graph_objects as go
+
         chat_names = []
         n_reactions = ([], [])
         most_common = ([], [])
@@ -415,6 +738,8 @@ class Chats:
         """Plot a bar chart with the number of messages (or percentage) in each chat.
         Optionally, include only messages that contain a specific string.
         """
+        import plotly.graph_objects as go
+
         chat_names = []
         vals = []
         if isinstance(messages_include, str):
@@ -423,28 +748,7 @@ class Chats:
         colors = []
         for chat in self:
             total_messages = len(chat.messages)
-            n_messages_you = sum(
-                1
-                for msg in chat.messages
-                if msg.from_ == self.your_name
-                and (
-                    messages_include is None
-                    or any(
-                        word.lower() in msg.text.lower() for word in messages_include
-                    )
-                )
-            )
-            n_messages_other = sum(
-                1
-                for msg in chat.messages
-                if msg.from_ != self.your_name
-                and (
-                    messages_include is None
-                    or any(
-                        word.lower() in msg.text.lower() for word in messages_include
-                    )
-                )
-            )
+            n_messages_you, n_messages_other = chat.count_messages(messages_include)
             chat_names.extend([chat.chat_with, chat.chat_with])
             senders.extend(["me", ""])
             colors.extend(["#1f77b4", "#ff7f0e"])
@@ -487,6 +791,8 @@ class Chats:
         self, groupby_key: GroupbyKeys, messages_include: str | list[str] | None = None
     ) -> go.Figure:
         """Plot a line chart with the number of messages by day."""
+        import plotly.graph_objects as go
+
         fig = go.Figure()
         if isinstance(messages_include, str):
             messages_include = [messages_include]
@@ -504,11 +810,17 @@ class Chats:
 
     def fig_other_message_types(self) -> go.Figure:
         """Plot a stacked bar chart of other message types for each chat."""
+        import plotly.graph_objects as go
+
         fig = go.Figure()
         data = {chat.chat_with: chat.get_other_msg_types() for chat in self}
-        all_types = set()
-        for types in data.values():
-            all_types.update(types.keys())
+        chat_names = list(data.keys())
+        all_types = sorted(set().union(*data.values()))
+        type_to_row = {msg_type: row for row, msg_type in enumerate(all_types)}
+        counts = np.zeros((len(all_types), len(chat_names)), dtype=np.int64)
+        for col, types in enumerate(data.values()):
+            for msg_type, count in types.items():
+                counts[type_to_row[msg_type], col] = count
 
         visible_types = {
             "code",
@@ -517,11 +829,11 @@ class Chats:
             "spoiler",
         }
 
-        for msg_type in all_types:
+        for msg_type, type_counts in zip(all_types, counts):
             fig.add_trace(
                 go.Bar(
-                    x=list(data.keys()),
-                    y=[data[person].get(msg_type, 0) for person in data.keys()],
+                    x=chat_names,
+                    y=type_counts.tolist(),
                     name=msg_type,
                     visible=True if msg_type in visible_types else "legendonly",
                 )
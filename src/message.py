@@ -1,9 +1,23 @@
+import sys
 from typing import Optional
 from datetime import datetime
 from dataclasses import dataclass, field
 
+try:
+    from ciso8601 import parse_datetime
+except ImportError:
+    parse_datetime = datetime.fromisoformat
 
-@dataclass
+# shared by every message without formatting entities (most of them)
+_NO_ENTITY_TYPES: frozenset[str] = frozenset()
+
+
+def _intern(name: str | None) -> str | None:
+    # sender names repeat on every message; share one object per name
+    return sys.intern(name) if name is not None else None
+
+
+@dataclass(slots=True)
 class Reaction:
     emoji: str
     from_when: list[tuple[str, datetime]]
@@ -13,7 +27,7 @@ class Reaction:
         return Reaction(
             emoji=reaction_dict["emoji"],
             from_when=[
-                (r["from"], datetime.fromisoformat(r["date"]))
+                (_intern(r["from"]), parse_datetime(r["date"]))
                 for r in reaction_dict.get("recent", [])
             ],
         )
@@ -23,7 +37,7 @@ def parse_reactions(reactions: list[dict]) -> list[Reaction]:
     return [Reaction.from_dict(r) for r in reactions if r.get("type") == "emoji"]
 
 
-@dataclass
+@dataclass(slots=True)
 class Message:
     id: int
     from_: str
@@ -32,30 +46,31 @@ class Message:
     edited_dt: datetime | None = None
     reply_to_id: int | None = None
     reply_to: Optional["Message"] = None
-    other_text_entity_types: set[str] = field(default_factory=set)
+    other_text_entity_types: frozenset[str] = _NO_ENTITY_TYPES
     reactions: list[Reaction] = field(default_factory=list)
 
     @classmethod
     def from_dict(cls, json_data: dict) -> "Message":
+        text_entities = json_data.get("text_entities", [])
+        reactions = json_data.get("reactions")
         return cls(
             id=json_data["id"],
-            from_=json_data["from"],
+            from_=_intern(json_data["from"]),
             text=(
                 txt
                 if isinstance((txt := json_data["text"]), str)
-                else "".join(te["text"] for te in json_data.get("text_entities", []))
+                else "".join(te["text"] for te in text_entities)
             ),
-            dt=datetime.fromisoformat(json_data["date"]),
-            edited_dt=datetime.fromisoformat(json_data["edited"])
+            dt=parse_datetime(json_data["date"]),
+            edited_dt=parse_datetime(json_data["edited"])
             if json_data.get("edited")
             else None,
             reply_to_id=json_data.get("reply_to_message_id"),
-            other_text_entity_types={
-                tp
-                for te in json_data.get("text_entities", [])
-                if (tp := te["type"]) != "plain"
-            },
-            reactions=parse_reactions(json_data.get("reactions", [])),
+            other_text_entity_types=frozenset(
+                sys.intern(tp) for te in text_entities if (tp := te["type"]) != "plain"
+            )
+            or _NO_ENTITY_TYPES,
+            reactions=parse_reactions(reactions) if reactions else [],
         )
 
     def __str__(self) -> str:
@@ -63,7 +78,9 @@ class Message:
 
 
 def reply_chain(message: Message) -> list[Message]:
-    res = [message]
-    if message.reply_to is None:
-        return res
-    return res + reply_chain(message.reply_to)
+    res = []
+    current = message
+    while current is not None:
+        res.append(current)
+        current = current.reply_to
+    return res